@@ -1,8 +1,9 @@
 from isoml.kernel._isokernel import IsoKernel
 from isoml.kernel._isodiskernel import IsoDisKernel
+from isoml.kernel._backends import register_backend
 
 # from isoml.kernel._ik_anne import IK_ANNE
 # from isoml.kernel._ik_iforest import IK_IForest
 # from isoml.kernel._ik_inne import IK_INNE
 
-__all__ = ["IsoKernel", "IsoDisKernel"]
+__all__ = ["IsoKernel", "IsoDisKernel", "register_backend"]
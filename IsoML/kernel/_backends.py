@@ -0,0 +1,43 @@
+"""
+Copyright 2024 Xin Han. All rights reserved.
+Use of this source code is governed by a BSD-style
+license that can be found in the LICENSE file.
+"""
+
+_BACKENDS = {}
+
+
+def register_backend(name):
+    """Register a class as an isolation kernel backend under `name`.
+
+    The registered class can then be selected with ``IsoKernel(method=name)``.
+    It is constructed as ``cls(n_estimators, max_samples, random_state,
+    n_jobs=n_jobs)`` and must provide ``_fit(X)``, ``_transform(X)`` and
+    ``_cell_ids(X)`` for already validated float64 or float32 input, as the built-in
+    backends do.
+
+    Parameters
+    ----------
+    name : str
+        The name of the backend.
+
+    Returns
+    -------
+    decorator : callable
+        Class decorator registering the class and returning it unchanged.
+
+    Examples
+    --------
+    >>> from isoml.kernel import IsoKernel, register_backend
+    >>> from isoml.kernel._ik_anne import IK_ANNE
+    >>> class MyANNE(IK_ANNE):
+    ...     pass
+    >>> register_backend("my_anne")(MyANNE)  # doctest: +SKIP
+    >>> ik = IsoKernel(method="my_anne")  # doctest: +SKIP
+    """
+
+    def decorator(cls):
+        _BACKENDS[name] = cls
+        return cls
+
+    return decorator
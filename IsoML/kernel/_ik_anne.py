@@ -5,15 +5,23 @@ license that can be found in the LICENSE file.
 """
 
 import numpy as np
+from joblib import effective_n_jobs
+from scipy.spatial import cKDTree
 from sklearn.base import BaseEstimator, TransformerMixin
-from sklearn.metrics import euclidean_distances
-from sklearn.utils import check_array
+from sklearn.utils import check_array, gen_batches
+from sklearn.utils._chunking import get_chunk_n_rows
+from sklearn.utils.extmath import row_norms
 from sklearn.utils.validation import check_is_fitted, check_random_state
 
-MAX_INT = np.iinfo(np.int32).max
-MIN_FLOAT = np.finfo(float).eps
+from ._backends import register_backend
+from ._utils import (
+    _cell_ids_to_features,
+    _sample_without_replacement,
+    _shift_to_float32,
+)
 
 
+@register_backend("anne")
 class IK_ANNE(TransformerMixin, BaseEstimator):
     """Build Isolation Kernel feature vector representations via the feature map
     for a given dataset.
@@ -50,6 +58,12 @@ class IK_ANNE(TransformerMixin, BaseEstimator):
         Pass an int for reproducible results across multiple function calls.
         See :term:`Glossary <random_state>`.
 
+    n_jobs : int, default=None
+        The number of jobs to run in parallel for the nearest center queries on
+        low-dimensional data.
+        ``None`` means 1 unless in a :obj:`joblib.parallel_backend` context.
+        ``-1`` means using all processors.
+
     References
     ----------
     .. [1] Qin, X., Ting, K.M., Zhu, Y. and Lee, V.C.
@@ -57,10 +71,13 @@ class IK_ANNE(TransformerMixin, BaseEstimator):
     In Proceedings of the AAAI Conference on Artificial Intelligence, Vol. 33, 2019, July, pp. 4755-4762
     """
 
-    def __init__(self, n_estimators, max_samples, random_state=None) -> None:
+    def __init__(
+        self, n_estimators, max_samples, random_state=None, n_jobs=None
+    ) -> None:
         self.n_estimators = n_estimators
         self.max_samples = max_samples
         self.random_state = random_state
+        self.n_jobs = n_jobs
 
     def fit(self, X, y=None):
         """Fit the model on data X.
@@ -73,22 +90,17 @@ class IK_ANNE(TransformerMixin, BaseEstimator):
         self : object
         """
 
-        X = check_array(X)
-        self.max_samples_ = self.max_samples
+        X = check_array(X, dtype=(np.float64, np.float32))
+        return self._fit(X)
+
+    def _fit(self, X):
+        """Fit the model on an already validated X."""
         n_samples = X.shape[0]
-        self.max_samples = min(self.max_samples_, n_samples)
+        self.max_samples_ = min(self.max_samples, n_samples)
         random_state = check_random_state(self.random_state)
-        self._seeds = random_state.randint(MAX_INT, size=self.n_estimators)
-
-        for i in range(self.n_estimators):
-            rnd = check_random_state(self._seeds[i])
-            center_index = rnd.choice(n_samples, self.max_samples_, replace=False)
-            if i == 0:
-                self.center_index_set = np.array([center_index])
-            else:
-                self.center_index_set = np.append(
-                    self.center_index_set, np.array([center_index]), axis=0
-                )
+        self.center_index_set = _sample_without_replacement(
+            random_state, n_samples, self.max_samples_, self.n_estimators
+        )
         self.unique_index = np.unique(self.center_index_set)
         self.center_data = X[self.unique_index]
 
@@ -104,22 +116,50 @@ class IK_ANNE(TransformerMixin, BaseEstimator):
         Returns
         -------
         The finite binary features based on the kernel feature map.
-        The features are organised as a n_instances by psi*t matrix.
+        The features are organised as a n_instances by psi*t sparse matrix
+        with exactly t non-zero entries per row.
         """
 
         check_is_fitted(self)
-        X = check_array(X)
-        n, m = X.shape
-        X_dists = euclidean_distances(X, self.center_data)
-        embedding = np.zeros([n, self.max_samples_ * self.n_estimators])
-
-        for i in range(n):
-            mapping_array = np.zeros(self.unique_index.max() + 1, dtype=X_dists.dtype)
-            mapping_array[self.unique_index] = X_dists[i]
-            x_center_dist_mat = mapping_array[self.center_index_set]
-            nearest_center_index = np.argmin(x_center_dist_mat, axis=1)
-            flatten_index = nearest_center_index + self.max_samples_ * np.array(
-                [range(self.n_estimators)]
-            )
-            embedding[i][flatten_index] = 1.0
-        return embedding
+        X = check_array(X, dtype=(np.float64, np.float32))
+        return self._transform(X)
+
+    def _transform(self, X):
+        """Compute the isolation kernel feature of an already validated X."""
+        return _cell_ids_to_features(self._cell_ids(X), self.max_samples_)
+
+    def _cell_ids(self, X):
+        """Index of the Voronoi cell X falls into in each partitioning.
+
+        Returns an int32 array of shape (n_instances, n_estimators).
+        """
+        n, n_features = X.shape
+        center_pos = np.searchsorted(self.unique_index, self.center_index_set)
+        cell_ids = np.empty((self.n_estimators, n), dtype=np.int32)
+
+        # A KD-tree per partitioning only beats the brute-force scan below in
+        # low dimensions, and there only once partitionings have many centers.
+        if n_features <= 2 or (n_features <= 5 and self.max_samples_ >= 64):
+            workers = effective_n_jobs(self.n_jobs)
+            for i in range(self.n_estimators):
+                center_tree = cKDTree(self.center_data[center_pos[i]])
+                _, cell_ids[i] = center_tree.query(X, k=1, workers=workers)
+            return cell_ids.T
+
+        # Distances are laid out center-major so that gathering the centers of
+        # one partitioning reads contiguous rows.
+        offset = self.center_data[0]
+        centers = _shift_to_float32(self.center_data, offset)
+        center_sq_norms = row_norms(centers, squared=True)[:, None]
+        chunk_n_rows = get_chunk_n_rows(
+            row_bytes=X.itemsize * self.unique_index.shape[0], max_n_rows=n
+        )
+        for batch in gen_batches(n, chunk_n_rows):
+            # ||x||^2 is the same for every center, so ||c||^2 - 2 c.x ranks
+            # the centers by distance without computing it.
+            center_dists = centers @ _shift_to_float32(X[batch], offset).T
+            center_dists *= -2
+            center_dists += center_sq_norms
+            for i in range(self.n_estimators):
+                cell_ids[i, batch] = np.argmin(center_dists[center_pos[i]], axis=0)
+        return cell_ids.T
@@ -4,19 +4,17 @@ Use of this source code is governed by a BSD-style
 license that can be found in the LICENSE file.
 """
 
-import numbers
-from warnings import warn
-
 import numpy as np
 from sklearn.base import BaseEstimator, TransformerMixin
-from sklearn.metrics import euclidean_distances
+from sklearn.ensemble import IsolationForest
 from sklearn.utils import check_array
-from sklearn.utils.validation import check_is_fitted, check_random_state
+from sklearn.utils.validation import check_is_fitted
 
-MAX_INT = np.iinfo(np.int32).max
-MIN_FLOAT = np.finfo(float).eps
+from ._backends import register_backend
+from ._utils import _cell_ids_to_features
 
 
+@register_backend("iforest")
 class IK_IForest(TransformerMixin, BaseEstimator):
     """Build Isolation Kernel feature vector representations via the feature map
     for a given dataset.
@@ -28,9 +26,14 @@ class IK_IForest(TransformerMixin, BaseEstimator):
 
     This version uses iforest to split the data space and calculate Isolation
     kernel Similarity. Based on this implementation, the feature
-    in the Isolation kernel space is the index of the cell in Voronoi diagrams. Each
-    point is represented as a binary vector such that only the cell the point falling
-    into is 1.
+    in the Isolation kernel space is the index of the leaf in each isolation tree.
+    Each point is represented as a binary vector such that only the leaf the point
+    falling into is 1.
+
+    The trees are those of scikit-learn's :class:`~sklearn.ensemble.IsolationForest`,
+    whose depth is limited to ``ceil(log2(max_samples))``. A leaf may therefore
+    hold several of the sampled points, so there can be fewer than `max_samples`
+    cells per tree, unlike in fully grown isolation trees.
 
     Parameters
     ----------
@@ -53,6 +56,11 @@ class IK_IForest(TransformerMixin, BaseEstimator):
         Pass an int for reproducible results across multiple function calls.
         See :term:`Glossary <random_state>`.
 
+    n_jobs : int, default=None
+        The number of jobs to run in parallel when building the isolation trees.
+        ``None`` means 1 unless in a :obj:`joblib.parallel_backend` context.
+        ``-1`` means using all processors.
+
     References
     ----------
     .. [1] Qin, X., Ting, K.M., Zhu, Y. and Lee, V.C.
@@ -60,4 +68,77 @@ class IK_IForest(TransformerMixin, BaseEstimator):
     In Proceedings of the AAAI Conference on Artificial Intelligence, Vol. 33, 2019, July, pp. 4755-4762
     """
 
-    pass
+    def __init__(
+        self, n_estimators, max_samples, random_state=None, n_jobs=None
+    ) -> None:
+        self.n_estimators = n_estimators
+        self.max_samples = max_samples
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+
+    def fit(self, X, y=None):
+        """Fit the model on data X.
+        Parameters
+        ----------
+        X : np.array of shape (n_samples, n_features)
+            The input instances.
+        Returns
+        -------
+        self : object
+        """
+
+        X = check_array(X, dtype=np.float32)
+        return self._fit(X)
+
+    def _fit(self, X):
+        """Fit the model on an already validated X."""
+        self.max_samples_ = min(self.max_samples, X.shape[0])
+        self.iforest = IsolationForest(
+            n_estimators=self.n_estimators,
+            max_samples=self.max_samples_,
+            random_state=self.random_state,
+            n_jobs=self.n_jobs,
+        ).fit(X)
+
+        # Number the leaves of each tree from 0; a tree built on max_samples
+        # points has at most max_samples leaves.
+        node_counts = [tree.tree_.node_count for tree in self.iforest.estimators_]
+        self.leaf_index = np.full((self.n_estimators, max(node_counts)), -1)
+        for i, tree in enumerate(self.iforest.estimators_):
+            is_leaf = tree.tree_.children_left == -1
+            self.leaf_index[i, : node_counts[i]][is_leaf] = np.arange(is_leaf.sum())
+
+        self.is_fitted_ = True
+        return self
+
+    def transform(self, X):
+        """Compute the isolation kernel feature of X.
+        Parameters
+        ----------
+        X: array-like of shape (n_instances, n_features)
+            The input instances.
+        Returns
+        -------
+        The finite binary features based on the kernel feature map.
+        The features are organised as a n_instances by psi*t sparse matrix
+        with exactly t non-zero entries per row.
+        """
+
+        check_is_fitted(self)
+        X = check_array(X, dtype=np.float32)
+        return self._transform(X)
+
+    def _transform(self, X):
+        """Compute the isolation kernel feature of an already validated X."""
+        return _cell_ids_to_features(self._cell_ids(X), self.max_samples_)
+
+    def _cell_ids(self, X):
+        """Index of the leaf X falls into in each isolation tree.
+
+        Returns an int32 array of shape (n_instances, n_estimators).
+        """
+        X = np.asarray(X, dtype=np.float32, order="C")
+        cell_ids = np.empty((self.n_estimators, X.shape[0]), dtype=np.int32)
+        for i, tree in enumerate(self.iforest.estimators_):
+            cell_ids[i] = self.leaf_index[i, tree.apply(X, check_input=False)]
+        return cell_ids.T
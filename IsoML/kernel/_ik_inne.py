@@ -4,19 +4,22 @@ Use of this source code is governed by a BSD-style
 license that can be found in the LICENSE file.
 """
 
-import numbers
-from warnings import warn
-
 import numpy as np
 from sklearn.base import BaseEstimator, TransformerMixin
-from sklearn.metrics import euclidean_distances
-from sklearn.utils import check_array
+from sklearn.utils import check_array, gen_batches
+from sklearn.utils._chunking import get_chunk_n_rows
+from sklearn.utils.extmath import row_norms
 from sklearn.utils.validation import check_is_fitted, check_random_state
 
-MAX_INT = np.iinfo(np.int32).max
-MIN_FLOAT = np.finfo(float).eps
+from ._backends import register_backend
+from ._utils import (
+    _cell_ids_to_features,
+    _sample_without_replacement,
+    _shift_to_float32,
+)
 
 
+@register_backend("inne")
 class IK_INNE(TransformerMixin, BaseEstimator):
     """Build Isolation Kernel feature vector representations via the feature map
     for a given dataset.
@@ -26,10 +29,10 @@ class IK_INNE(TransformerMixin, BaseEstimator):
     the characteristics of the local data distribution. It has been shown promising
     performance on density and distance-based classification and clustering problems.
 
-    This version uses iforest to split the data space and calculate Isolation
-    kernel Similarity. Based on this implementation, the feature
-    in the Isolation kernel space is the index of the cell in Voronoi diagrams. Each
-    point is represented as a binary vector such that only the cell the point falling
+    This version uses hyperspheres centred at the sampled points to split the data
+    space and calculate Isolation kernel Similarity. The radius of each hypersphere
+    is the distance from its center to the nearest other center. Each point is
+    represented as a binary vector such that only the hypersphere the point falling
     into is 1.
 
     Parameters
@@ -53,6 +56,9 @@ class IK_INNE(TransformerMixin, BaseEstimator):
         Pass an int for reproducible results across multiple function calls.
         See :term:`Glossary <random_state>`.
 
+    n_jobs : int, default=None
+        Not used, present for API consistency with the other backends.
+
     References
     ----------
     .. [1] Qin, X., Ting, K.M., Zhu, Y. and Lee, V.C.
@@ -60,133 +66,117 @@ class IK_INNE(TransformerMixin, BaseEstimator):
     In Proceedings of the AAAI Conference on Artificial Intelligence, Vol. 33, 2019, July, pp. 4755-4762
     """
 
-    def __init__(self, n_estimators, max_samples, random_state=None) -> None:
+    def __init__(
+        self, n_estimators, max_samples, random_state=None, n_jobs=None
+    ) -> None:
         self.n_estimators = n_estimators
         self.max_samples = max_samples
         self.random_state = random_state
-
-    import numpy as np
-
-
-from random import sample
-from scipy.spatial.distance import cdist
-from scipy.sparse import csr_matrix
-
-
-class iNN_IK:
-    data = None
-    centroid = []
-
-    def __init__(self, psi, t):
-        self.psi = psi
-        self.t = t
-
-    # def fit_transform(self, data):
-    #     self.data = data
-    #     self.centroid = []
-    #     self.centroids_radius = []
-    #     sn = self.data.shape[0]
-    #     n, d = self.data.shape
-    #     IDX = np.array([])  #column index
-    #     V = []
-    #     for i in range(self.t):
-    #         subIndex = sample(range(sn), self.psi)
-    #         self.centroid.append(subIndex)
-    #         tdata = self.data[subIndex, :]
-    #         tt_dis = cdist(tdata, tdata)
-    #         radius = [] #restore centroids' radius
-    #         for r_idx in range(self.psi):
-    #             r = tt_dis[r_idx]
-    #             r[r<0] = 0
-    #             r = np.delete(r,r_idx)
-    #             radius.append(np.min(r))
-    #         self.centroids_radius.append(radius)
-    #         nt_dis = cdist(tdata, self.data)
-    #         centerIdx = np.argmin(nt_dis, axis=0)
-    #         for j in range(n):
-    #             V.append(int(nt_dis[centerIdx[j],j] <= radius[centerIdx[j]]))
-    #         IDX = np.concatenate((IDX, centerIdx + i * self.psi), axis=0)
-    #     IDR = np.tile(range(n), self.t) #row index
-    #     #V = np.ones(self.t * n) #value
-    #     ndata = csr_matrix((V, (IDR, IDX)), shape=(n, self.t * self.psi))
-    #     return ndata
-
-    def fit(self, data):
-        self.data = data
-        self.centroid = []
-        self.centroids_radius = []
-        sn = self.data.shape[0]
-        for i in range(self.t):
-            subIndex = sample(range(sn), self.psi)
-            self.centroid.append(subIndex)
-            tdata = self.data[subIndex, :]
-            tt_dis = cdist(tdata, tdata)
-            radius = []  # restore centroids' radius
-            for r_idx in range(self.psi):
-                r = tt_dis[r_idx]
-                r[r < 0] = 0
-                r = np.delete(r, r_idx)
-                radius.append(np.min(r))
-            self.centroids_radius.append(radius)
-
-    def transform(self, newdata):
-        assert self.centroid != None, "invoke fit() first!"
-        n, d = newdata.shape
-        IDX = np.array([])
-        V = []
-        for i in range(self.t):
-            subIndex = self.centroid[i]
-            radius = self.centroids_radius[i]
-            tdata = self.data[subIndex, :]
-            dis = cdist(tdata, newdata)
-            centerIdx = np.argmin(dis, axis=0)
-            for j in range(n):
-                V.append(int(dis[centerIdx[j], j] <= radius[centerIdx[j]]))
-            IDX = np.concatenate((IDX, centerIdx + i * self.psi), axis=0)
-        IDR = np.tile(range(n), self.t)
-        ndata = csr_matrix((V, (IDR, IDX)), shape=(n, self.t * self.psi))
-        return ndata
+        self.n_jobs = n_jobs
 
     def fit(self, X, y=None):
-        """Fit the model with the given training data.
-
+        """Fit the model on data X.
         Parameters
         ----------
-        X : array-like of shape (n_samples, n_features)
-            The training data.
-
-        y : None
-            Ignored.
-
+        X : np.array of shape (n_samples, n_features)
+            The input instances.
         Returns
         -------
         self : object
-            Returns self.
         """
-        X = check_array(X)
-        self._validate_hyperparameters()
-        self._fit(X)
-        return self
+
+        X = check_array(X, dtype=(np.float64, np.float32))
+        return self._fit(X)
 
     def _fit(self, X):
-        pass
+        """Fit the model on an already validated X."""
+        n_samples = X.shape[0]
+        self.max_samples_ = min(self.max_samples, n_samples)
+        random_state = check_random_state(self.random_state)
+        self.center_index_set = _sample_without_replacement(
+            random_state, n_samples, self.max_samples_, self.n_estimators
+        )
+        self.center_radius = _hypersphere_radii(X, self.center_index_set)
+        self.unique_index = np.unique(self.center_index_set)
+        self.center_data = X[self.unique_index]
+
+        self.is_fitted_ = True
+        return self
 
     def transform(self, X):
-        """Transform the given data into the Isolation Kernel feature space.
-
+        """Compute the isolation kernel feature of X.
         Parameters
         ----------
-        X : array-like of shape (n_samples, n_features)
-            The data to transform.
-
+        X: array-like of shape (n_instances, n_features)
+            The input instances.
         Returns
         -------
-        X_new : array-like of shape (n_samples, n_features)
-            The transformed data.
+        The finite binary features based on the kernel feature map.
+        The features are organised as a n_instances by psi*t sparse matrix.
+        A point falling outside every hypersphere of a partitioning has no
+        non-zero entry for it.
         """
+
         check_is_fitted(self)
-        X = check_array(X)
+        X = check_array(X, dtype=(np.float64, np.float32))
         return self._transform(X)
 
     def _transform(self, X):
-        pass
+        """Compute the isolation kernel feature of an already validated X."""
+        return _cell_ids_to_features(self._cell_ids(X), self.max_samples_)
+
+    def _cell_ids(self, X):
+        """Index of the hypersphere X falls into in each partitioning.
+
+        Returns an int32 array of shape (n_instances, n_estimators), holding -1
+        where a point falls outside every hypersphere of the partitioning.
+        """
+        n = X.shape[0]
+        center_pos = np.searchsorted(self.unique_index, self.center_index_set)
+        cell_ids = np.empty((self.n_estimators, n), dtype=np.int32)
+        offset = self.center_data[0]
+        centers = _shift_to_float32(self.center_data, offset)
+        center_sq_norms = row_norms(centers, squared=True)[:, None]
+        sq_radius = self.center_radius**2
+        chunk_n_rows = get_chunk_n_rows(
+            row_bytes=X.itemsize * self.unique_index.shape[0], max_n_rows=n
+        )
+        for batch in gen_batches(n, chunk_n_rows):
+            # ||x - c||^2 = ||x||^2 + ||c||^2 - 2 c.x, where ||x||^2 does not
+            # change the nearest center and is only added back for the radius test.
+            X_batch = _shift_to_float32(X[batch], offset)
+            center_dists = centers @ X_batch.T
+            center_dists *= -2
+            center_dists += center_sq_norms
+            x_sq_norms = row_norms(X_batch, squared=True)
+            for i in range(self.n_estimators):
+                dists = center_dists[center_pos[i]]
+                nearest = np.argmin(dists, axis=0)
+                nearest_dist = np.take_along_axis(dists, nearest[None], axis=0)[0]
+                nearest_dist += x_sq_norms
+                covered = np.maximum(nearest_dist, 0) <= sq_radius[i, nearest]
+                cell_ids[i, batch] = np.where(covered, nearest, -1)
+        return cell_ids.T
+
+
+def _hypersphere_radii(X, center_index_set):
+    """Radii of the hyperspheres of every partitioning.
+
+    The radius of each center is the distance to its nearest neighbouring
+    center in the same sample. All partitionings are computed in batches from
+    the differences of the centers, which stay exact for data far from the
+    origin. Returns an array of shape (n_estimators, max_samples).
+    """
+    n_estimators, max_samples = center_index_set.shape
+    sq_radius = np.empty((n_estimators, max_samples), dtype=X.dtype)
+    diagonal = np.arange(max_samples)
+    chunk_n_rows = get_chunk_n_rows(
+        row_bytes=X.itemsize * max_samples * max_samples * X.shape[1],
+        max_n_rows=n_estimators,
+    )
+    for batch in gen_batches(n_estimators, chunk_n_rows):
+        centers = X[center_index_set[batch]]
+        center_dists = ((centers[:, :, None] - centers[:, None]) ** 2).sum(axis=-1)
+        center_dists[:, diagonal, diagonal] = np.inf
+        sq_radius[batch] = center_dists.min(axis=-1)
+    return np.sqrt(sq_radius)
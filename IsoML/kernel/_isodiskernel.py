@@ -77,16 +77,16 @@ class IsoDisKernel(BaseEstimator, TransformerMixin):
         -------
         self : object
         """
-        X = check_array(X)
+        X = check_array(X, dtype=(np.float64, np.float32))
         iso_kernel = IsoKernel(
             self.method, self.n_estimators, self.max_samples, self.random_state
         )
-        self.iso_kernel = iso_kernel.fit(X)
+        self.iso_kernel = iso_kernel._fit(X)
         self.is_fitted_ = True
         return self
 
     def kernel_mean_embedding(self, X):
-        return np.mean(X, axis=0)
+        return np.asarray(X.mean(axis=0)).ravel()
 
     def kme_similarity(self, kme_D_i, kme_D_j, is_normalize=False):
         if is_normalize:
@@ -109,12 +109,27 @@ class IsoDisKernel(BaseEstimator, TransformerMixin):
         -------
         The Isolation distribution similarity of given two dataset.
         """
-        emb_D_i, emb_D_j = self.transform(D_i, D_j)
-        kme_D_i, kme_D_j = self.kernel_mean_embedding(
-            emb_D_i
-        ), self.kernel_mean_embedding(emb_D_j)
+        check_is_fitted(self)
+        D_i = check_array(D_i, dtype=(np.float64, np.float32))
+        D_j = check_array(D_j, dtype=(np.float64, np.float32))
+        kme_D_i = self._kernel_mean_embedding(D_i)
+        kme_D_j = self._kernel_mean_embedding(D_j)
         return self.kme_similarity(kme_D_i, kme_D_j, is_normalize=is_normalize)
 
+    def _kernel_mean_embedding(self, X):
+        """Kernel mean embedding of an already validated X.
+
+        Counts how often each cell is hit directly from the cell indices, without
+        building the psi*t binary features of every instance.
+        """
+        cell_ids = self.iso_kernel._cell_ids(X)
+        max_samples = self.iso_kernel.max_samples_
+        cols = cell_ids + max_samples * np.arange(self.n_estimators)
+        cell_counts = np.bincount(
+            cols[cell_ids >= 0], minlength=max_samples * self.n_estimators
+        )
+        return cell_counts / X.shape[0]
+
     def transform(self, D_i, D_j):
         """Compute the isolation kernel feature of D_i and D_j.
         Parameters
@@ -126,9 +141,10 @@ class IsoDisKernel(BaseEstimator, TransformerMixin):
         Returns
         -------
         The finite binary features based on the kernel feature map.
-        The features are organised as a n_instances by psi*t matrix.
+        The features are organised as a n_instances by psi*t sparse matrix
+        in CSR format.
         """
         check_is_fitted(self)
-        D_i = check_array(D_i)
-        D_j = check_array(D_j)
-        return self.iso_kernel.transform(D_i), self.iso_kernel.transform(D_j)
+        D_i = check_array(D_i, dtype=(np.float64, np.float32))
+        D_j = check_array(D_j, dtype=(np.float64, np.float32))
+        return self.iso_kernel._transform(D_i), self.iso_kernel._transform(D_j)
@@ -9,11 +9,13 @@ from warnings import warn
 
 import numpy as np
 from sklearn.base import BaseEstimator, TransformerMixin
-from sklearn.utils import check_array
+from sklearn.utils import check_array, gen_batches
+from sklearn.utils._chunking import get_chunk_n_rows
 from sklearn.utils.validation import check_is_fitted
-from ._ik_anne import IK_ANNE
-from ._ik_iforest import IK_IForest
-from ._ik_inne import IK_INNE
+from . import _ik_anne, _ik_iforest, _ik_inne  # noqa: F401 register the backends
+from ._backends import _BACKENDS
+
+_WARNED_MAX_SAMPLES = set()
 
 
 class IsoKernel(TransformerMixin, BaseEstimator):
@@ -33,8 +35,10 @@ class IsoKernel(TransformerMixin, BaseEstimator):
 
     Parameters
     ----------
-    method : str, default="anne"
+    method : str or class, default="anne"
         The method to compute the isolation kernel feature. The available methods are: `anne`, `inne`, and `iforest`.
+        Backends added with :func:`register_backend` can be selected by name, or a
+        backend class can be passed directly.
 
     n_estimators : int, default=200
         The number of base estimators in the ensemble.
@@ -54,6 +58,15 @@ class IsoKernel(TransformerMixin, BaseEstimator):
         Pass an int for reproducible results across multiple function calls.
         See :term:`Glossary <random_state>`.
 
+    n_jobs : int, default=None
+        The number of jobs to run in parallel. What runs in parallel depends on
+        `method`: with "anne" it is the nearest center queries on low-dimensional
+        data in `transform` and `similarity` (`fit` is not parallelized); with
+        "iforest" it is the building of the isolation trees in `fit`. "inne"
+        does not use it.
+        ``None`` means 1 unless in a :obj:`joblib.parallel_backend` context.
+        ``-1`` means using all processors.
+
     References
     ----------
     .. [1] Qin, X., Ting, K.M., Zhu, Y. and Lee, V.C.
@@ -71,12 +84,18 @@ class IsoKernel(TransformerMixin, BaseEstimator):
     """
 
     def __init__(
-        self, method="anne", n_estimators=200, max_samples="auto", random_state=None
+        self,
+        method="anne",
+        n_estimators=200,
+        max_samples="auto",
+        random_state=None,
+        n_jobs=None,
     ) -> None:
         self.n_estimators = n_estimators
         self.max_samples = max_samples
         self.random_state = random_state
         self.method = method
+        self.n_jobs = n_jobs
 
     def fit(self, X, y=None):
         """Fit the model on data X.
@@ -89,71 +108,95 @@ class IsoKernel(TransformerMixin, BaseEstimator):
         self : object
         """
 
-        X = check_array(X)
-        n_samples = X.shape[0]
-        if isinstance(self.max_samples, str):
-            if self.max_samples == "auto":
-                max_samples = min(16, n_samples)
-            else:
-                raise ValueError(
-                    "max_samples (%s) is not supported."
-                    'Valid choices are: "auto", int or'
-                    "float" % self.max_samples
-                )
-        elif isinstance(self.max_samples, numbers.Integral):
-            if self.max_samples > n_samples:
-                warn(
-                    "max_samples (%s) is greater than the "
-                    "total number of samples (%s). max_samples "
-                    "will be set to n_samples for estimation."
-                    % (self.max_samples, n_samples)
-                )
-                max_samples = n_samples
-            else:
-                max_samples = self.max_samples
-        else:  # float
-            if not 0.0 < self.max_samples <= 1.0:
-                raise ValueError(
-                    "max_samples must be in (0, 1], got %r" % self.max_samples
-                )
-            max_samples = int(self.max_samples * X.shape[0])
-        self.max_samples_ = max_samples
+        X = check_array(X, dtype=(np.float64, np.float32))
+        return self._fit(X)
 
-        if self.method == "anne":
-            self.iso_kernel_ = IK_ANNE(
-                self.n_estimators, self.max_samples_, self.random_state
-            )
-        elif self.method == "inne":
-            self.iso_kernel_ = IK_INNE(
-                self.n_estimators, self.max_samples_, self.random_state
-            )
-        elif self.method == "iforest":
-            self.iso_kernel_ = IK_IForest(
-                self.n_estimators, self.max_samples_, self.random_state
-            )
+    def _fit(self, X):
+        """Fit the model on an already validated X."""
+        if isinstance(self.method, type):
+            backend = self.method
+        elif isinstance(self.method, str) and self.method in _BACKENDS:
+            backend = _BACKENDS[self.method]
         else:
             raise ValueError(
-                "method (%s) is not supported."
-                'Valid choices are: "anne", "inne" or "iforest"' % self.method
+                "method (%s) is not supported. Valid choices are: %s or a backend class"
+                % (self.method, ", ".join('"%s"' % name for name in _BACKENDS))
             )
-
-        self.iso_kernel_.fit(X)
+        self.max_samples_ = _resolve_max_samples(self.max_samples, X.shape[0])
+        self.iso_kernel_ = backend(
+            self.n_estimators,
+            self.max_samples_,
+            self.random_state,
+            n_jobs=self.n_jobs,
+        )
+        self.iso_kernel_._fit(X)
         self.is_fitted_ = True
         return self
 
-    def similarity(self, X):
+    def similarity(self, X, block_size=None, out=None):
         """Compute the isolation kernel pairwise simalarity matrix of X.
+
+        The similarity of two instances is the fraction of partitionings in which
+        they fall into the same cell. It is computed from the cell indices
+        directly, without building the psi*t binary features.
+
         Parameters
         ----------
         X: array-like of shape (n_instances, n_features)
             The input instances.
+        block_size: int, default=None
+            The number of rows of the simalarity matrix computed at a time.
+            Smaller blocks bound the memory used by intermediate results. If
+            None, at most 256 rows, fewer if scikit-learn's `working_memory`
+            setting requires it.
+        out: ndarray of shape (n_instances, n_instances), default=None
+            Array in which to store the result, e.g. a `numpy.memmap` when
+            the matrix does not fit in memory. Allocated if not given. Rows
+            are written block by block, whole rows at a time.
         Returns
         -------
         The simalarity matrix are organised as a n_instances * n_instances matrix.
         """
 
-        embed_X = self.transform(X)
-        return np.inner(embed_X, embed_X) / self.n_estimators
+        check_is_fitted(self)
+        X = check_array(X, dtype=(np.float64, np.float32))
+        # Cell indices range over [-2, max_samples) below; storing them in the
+        # narrowest signed type that holds them (int8 for up to 128 cells) cuts
+        # the bytes read by every comparison.
+        id_dtype = np.min_scalar_type(-max(self.max_samples_, 2))
+        cell_ids = self._cell_ids(X).T.astype(id_dtype, order="C")
+        # Instances outside every cell of a partitioning are marked -1; marking
+        # them -2 on the other side keeps them from matching each other.
+        other_ids = np.where(cell_ids < 0, -2, cell_ids).astype(id_dtype)
+        n = cell_ids.shape[1]
+        # The matrix is symmetric: in an array of our own, each block of rows is
+        # only compared with the instances from its first row onwards and
+        # mirrored into the columns. A supplied `out` may be a memmap, where the
+        # strided column writes of the mirror would touch every page per block,
+        # so whole rows are computed instead.
+        mirror = out is None
+        if out is None:
+            out = np.empty((n, n), dtype=np.float32)
+        elif out.shape != (n, n):
+            raise ValueError("out must have shape (%d, %d), got %r" % (n, n, out.shape))
+        # The narrowest counter that holds n_estimators keeps accumulation cheap.
+        count_dtype = np.min_scalar_type(self.n_estimators)
+        if block_size is None:
+            block_size = get_chunk_n_rows(
+                row_bytes=(count_dtype.itemsize + 1) * n, max_n_rows=256
+            )
+
+        for batch in gen_batches(n, block_size):
+            start = batch.start if mirror else 0
+            matches = np.zeros((batch.stop - batch.start, n - start), count_dtype)
+            for ids, others in zip(cell_ids[:, batch], other_ids[:, start:]):
+                matches += ids[:, None] == others
+            block = matches.astype(np.float32)
+            block /= self.n_estimators
+            out[batch, start:] = block
+            if mirror:
+                out[start:, batch] = block.T
+        return out
 
     def transform(self, X):
         """Compute the isolation kernel feature of X.
@@ -164,9 +207,48 @@ class IsoKernel(TransformerMixin, BaseEstimator):
         Returns
         -------
         The finite binary features based on the kernel feature map.
-        The features are organised as a n_instances by psi*t matrix.
+        The features are organised as a n_instances by psi*t sparse matrix
+        in CSR format.
         """
 
         check_is_fitted(self)
-        X = check_array(X)
-        return self.iso_kernel_.transform(X)
+        X = check_array(X, dtype=(np.float64, np.float32))
+        return self._transform(X)
+
+    def _transform(self, X):
+        """Compute the isolation kernel feature of an already validated X."""
+        return self.iso_kernel_._transform(X)
+
+    def _cell_ids(self, X):
+        """Cell index of an already validated X in each partitioning."""
+        return self.iso_kernel_._cell_ids(X)
+
+
+def _resolve_max_samples(max_samples, n_samples):
+    """Number of samples drawn for each partitioning given `max_samples`."""
+    if isinstance(max_samples, str):
+        if max_samples == "auto":
+            return min(16, n_samples)
+        raise ValueError(
+            'max_samples (%s) is not supported. Valid choices are: "auto", int or float'
+            % max_samples
+        )
+    if isinstance(max_samples, numbers.Integral):
+        if max_samples > n_samples:
+            # Warn once per setting: fitting many small subsets, e.g. once per
+            # cluster, would otherwise go through the warnings machinery each time.
+            if (max_samples, n_samples) not in _WARNED_MAX_SAMPLES:
+                _WARNED_MAX_SAMPLES.add((max_samples, n_samples))
+                warn(
+                    "max_samples (%s) is greater than the "
+                    "total number of samples (%s). max_samples "
+                    "will be set to n_samples for estimation."
+                    % (max_samples, n_samples),
+                    stacklevel=4,
+                )
+            return n_samples
+        return max_samples
+    # float
+    if not 0.0 < max_samples <= 1.0:
+        raise ValueError("max_samples must be in (0, 1], got %r" % max_samples)
+    return int(max_samples * n_samples)
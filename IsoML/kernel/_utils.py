@@ -0,0 +1,73 @@
+"""
+Copyright 2024 Xin Han. All rights reserved.
+Use of this source code is governed by a BSD-style
+license that can be found in the LICENSE file.
+"""
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.utils import gen_batches
+from sklearn.utils._chunking import get_chunk_n_rows
+
+
+def _cell_ids_to_features(cell_ids, max_samples):
+    """Binary isolation kernel features from the cell IDs of each partitioning.
+
+    `cell_ids` has shape (n_instances, n_estimators), with -1 where an instance
+    falls into no cell. Tree `t` owns the columns `[t * max_samples, (t + 1) *
+    max_samples)`, so the column indices of a row come out already sorted and the
+    CSR arrays are built directly, without a COO intermediate.
+    """
+    n, n_estimators = cell_ids.shape
+    covered = cell_ids >= 0
+    cols = cell_ids + max_samples * np.arange(n_estimators, dtype=cell_ids.dtype)
+    if covered.all():
+        indices = cols.ravel()
+        indptr = np.arange(0, n * n_estimators + 1, n_estimators)
+    else:
+        indices = cols[covered]
+        indptr = np.concatenate([[0], np.cumsum(covered.sum(axis=1))])
+    data = np.ones(indices.shape[0], dtype=np.float32)
+    return csr_matrix((data, indices, indptr), shape=(n, max_samples * n_estimators))
+
+
+def _shift_to_float32(X, offset):
+    """Return `X - offset` as float32.
+
+    Ranking centers by ``||c||^2 - 2 c.x`` in float32 cancels catastrophically
+    when the data sits far from the origin. Shifting both the centers and the
+    instances by one of the centers first keeps the norms on the scale of the
+    data's spread. The subtraction is done in the precision of `X`, so only
+    the shifted values are rounded to float32.
+    """
+    return np.asarray(X - offset, dtype=np.float32)
+
+
+def _sample_without_replacement(random_state, n_samples, max_samples, n_estimators):
+    """Draw `max_samples` distinct indices below `n_samples` for every estimator.
+
+    All estimators are drawn in one batch. Returns an array of shape
+    (n_estimators, max_samples).
+    """
+    if max_samples * max_samples <= n_samples:
+        # Repeated indices are rare in this regime: draw with replacement and
+        # redraw the few rows that contain one.
+        index_set = random_state.randint(n_samples, size=(n_estimators, max_samples))
+        while True:
+            sorted_set = np.sort(index_set, axis=1)
+            repeated = (sorted_set[:, 1:] == sorted_set[:, :-1]).any(axis=1)
+            if not repeated.any():
+                return index_set
+            index_set[repeated] = random_state.randint(
+                n_samples, size=(repeated.sum(), max_samples)
+            )
+
+    # The first max_samples positions of random keys form a uniform sample.
+    index_set = np.empty((n_estimators, max_samples), dtype=np.intp)
+    chunk_n_rows = get_chunk_n_rows(row_bytes=8 * n_samples, max_n_rows=n_estimators)
+    for batch in gen_batches(n_estimators, chunk_n_rows):
+        keys = random_state.random_sample((batch.stop - batch.start, n_samples))
+        index_set[batch] = np.argpartition(keys, max_samples - 1, axis=1)[
+            :, :max_samples
+        ]
+    return index_set
@@ -4,6 +4,7 @@ Use of this source code is governed by a BSD-style
 license that can be found in the LICENSE file.
 """
 
+import numpy as np
 from sklearn.datasets import load_iris
 from isoml.kernel._isodiskernel import IsoDisKernel
 import pytest
@@ -40,3 +41,16 @@ def test_IsoDisKernel_transform(data):
     transformed_D_i, transformed_D_j = idk.transform(D_i, D_j)
     assert transformed_D_i.shape == (10, idk.n_estimators * idk.max_samples_)
     assert transformed_D_j.shape == (10, idk.n_estimators * idk.max_samples_)
+
+
+def test_IsoDisKernel_similarity_matches_embedding(data):
+    X = data[0]
+    idk = IsoDisKernel(method="anne", n_estimators=200, random_state=0)
+    idk.fit(X)
+    emb_D_i, emb_D_j = idk.transform(X[:50], X[50:])
+    expected = idk.kme_similarity(
+        idk.kernel_mean_embedding(emb_D_i),
+        idk.kernel_mean_embedding(emb_D_j),
+        is_normalize=True,
+    )
+    assert np.isclose(idk.similarity(X[:50], X[50:]), expected)
@@ -4,7 +4,14 @@ Use of this source code is governed by a BSD-style
 license that can be found in the LICENSE file.
 """
 
+import warnings
+
+import numpy as np
+from scipy.sparse import issparse
 from sklearn.datasets import load_iris
+from isoml.kernel import _backends, _isokernel, register_backend
+from isoml.kernel._ik_anne import IK_ANNE
+from isoml.kernel._ik_inne import IK_INNE
 from isoml.kernel._isokernel import IsoKernel
 import pytest
 
@@ -35,3 +42,161 @@ def test_IsoKernel_transform(data):
     ik.fit(X)
     transformed_X = ik.transform(X)
     assert transformed_X.shape == (X.shape[0], ik.n_estimators * ik.max_samples_)
+
+
+def test_IsoKernel_transform_sparse(data):
+    X = data[0]
+    ik = IsoKernel(method="anne", n_estimators=200, max_samples="auto")
+    ik.fit(X)
+    transformed_X = ik.transform(X)
+    assert issparse(transformed_X)
+    assert np.all(transformed_X.getnnz(axis=1) == ik.n_estimators)
+    assert np.allclose(np.diag(ik.similarity(X)), 1.0)
+
+
+def test_IsoKernel_similarity_block_size(data):
+    X = data[0]
+    ik = IsoKernel(method="anne", n_estimators=200, max_samples="auto")
+    ik.fit(X)
+    out = np.zeros((X.shape[0], X.shape[0]), dtype=np.float32)
+    similarity = ik.similarity(X, block_size=16, out=out)
+    assert similarity is out
+    assert np.allclose(similarity, ik.similarity(X))
+
+
+def test_IsoKernel_similarity_memmap(data, tmp_path):
+    X = data[0]
+    ik = IsoKernel(method="inne", n_estimators=100, random_state=0).fit(X)
+    out = np.memmap(
+        tmp_path / "similarity.dat", dtype=np.float32, mode="w+", shape=(len(X),) * 2
+    )
+    similarity = ik.similarity(X, block_size=32, out=out)
+    assert similarity is out
+    assert np.array_equal(similarity, ik.similarity(X))
+
+
+@pytest.mark.parametrize("method", ["anne", "inne", "iforest"])
+def test_IsoKernel_n_jobs(data, method):
+    X = data[0]
+    ik = IsoKernel(method=method, n_estimators=50, random_state=0)
+    ik_parallel = IsoKernel(method=method, n_estimators=50, random_state=0, n_jobs=2)
+    ik.fit(X)
+    ik_parallel.fit(X)
+    assert np.allclose(ik.similarity(X), ik_parallel.similarity(X))
+
+
+@pytest.mark.parametrize("method", ["anne", "inne", "iforest"])
+def test_IsoKernel_similarity_matches_embedding(data, method):
+    X = data[0]
+    ik = IsoKernel(method=method, n_estimators=100, random_state=0)
+    ik.fit(X)
+    embed_X = ik.transform(X)
+    expected = (embed_X @ embed_X.T).toarray() / ik.n_estimators
+    assert np.allclose(ik.similarity(X), expected)
+
+
+@pytest.mark.parametrize("max_samples", [8, 16, 150])
+def test_IsoKernel_distinct_centers(data, max_samples):
+    X = data[0]
+    ik = IsoKernel(method="anne", max_samples=max_samples, random_state=0)
+    ik.fit(X)
+    center_index_set = np.sort(ik.iso_kernel_.center_index_set, axis=1)
+    assert center_index_set.shape == (ik.n_estimators, max_samples)
+    assert np.all(center_index_set[:, 1:] != center_index_set[:, :-1])
+
+
+@pytest.mark.parametrize("max_samples", [16, 64])
+def test_IsoKernel_low_dimensional(max_samples):
+    X = np.random.RandomState(0).rand(300, 2)
+    ik = IsoKernel(method="anne", max_samples=max_samples, random_state=0)
+    ik.fit(X)
+    anne = ik.iso_kernel_
+    centers = X[anne.center_index_set]
+    dists = ((X[:, None, None, :] - centers[None]) ** 2).sum(axis=-1)
+    assert np.array_equal(anne._cell_ids(X), dists.argmin(axis=-1))
+
+
+def test_IsoKernel_backend_class(data):
+    X = data[0]
+    ik = IsoKernel(method="anne", n_estimators=50, random_state=0).fit(X)
+    ik_class = IsoKernel(method=IK_ANNE, n_estimators=50, random_state=0).fit(X)
+    assert np.allclose(ik.similarity(X), ik_class.similarity(X))
+
+
+def test_IsoKernel_register_backend(data, monkeypatch):
+    X = data[0]
+    monkeypatch.setattr(_backends, "_BACKENDS", dict(_backends._BACKENDS))
+    monkeypatch.setattr(_isokernel, "_BACKENDS", _backends._BACKENDS)
+
+    @register_backend("test_anne")
+    class TestANNE(IK_ANNE):
+        pass
+
+    ik = IsoKernel(method="test_anne", n_estimators=50).fit(X)
+    assert isinstance(ik.iso_kernel_, TestANNE)
+
+
+@pytest.mark.parametrize("method", ["unknown", None, 5])
+def test_IsoKernel_unsupported_method(data, method):
+    with pytest.raises(ValueError, match="not supported"):
+        IsoKernel(method=method).fit(data[0])
+
+
+def test_IsoKernel_max_samples_warns_once(data, monkeypatch):
+    monkeypatch.setattr(_isokernel, "_WARNED_MAX_SAMPLES", set())
+    X = data[0][:20]
+    ik = IsoKernel(method="anne", n_estimators=10, max_samples=21)
+    with pytest.warns(UserWarning, match="max_samples"):
+        ik.fit(X)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        ik.fit(X)
+    assert ik.max_samples_ == X.shape[0]
+
+
+@pytest.mark.parametrize("method", ["anne", "inne"])
+@pytest.mark.parametrize("shift", [0.0, 1e3, 1e4, 1e5, 1e6])
+def test_IsoKernel_cell_ids_far_from_origin(method, shift):
+    X = np.random.RandomState(0).randn(500, 10) + shift
+    ik = IsoKernel(method=method, n_estimators=50, random_state=0).fit(X)
+    backend = ik.iso_kernel_
+    centers = X[backend.center_index_set]
+    dists = ((X[:, None, None, :] - centers[None]) ** 2).sum(axis=-1)
+    expected = dists.argmin(axis=-1)
+    if method == "inne":
+        center_dists = ((centers[:, :, None] - centers[:, None]) ** 2).sum(axis=-1)
+        center_dists[:, np.arange(ik.max_samples_), np.arange(ik.max_samples_)] = np.inf
+        sq_radius = center_dists.min(axis=-1)
+        trees = np.arange(ik.n_estimators)
+        covered = dists.min(axis=-1) <= sq_radius[trees, expected]
+        expected = np.where(covered, expected, -1)
+    assert np.array_equal(backend._cell_ids(X), expected)
+
+
+@pytest.mark.parametrize("method", ["anne", "inne"])
+@pytest.mark.parametrize("max_samples", [1, 128, 129])
+def test_IsoKernel_similarity_cell_id_dtype(data, method, max_samples):
+    X = data[0]
+    ik = IsoKernel(method=method, n_estimators=20, max_samples=max_samples)
+    ik.fit(X)
+    embed_X = ik.transform(X)
+    expected = (embed_X @ embed_X.T).toarray() / ik.n_estimators
+    assert np.allclose(ik.similarity(X), expected)
+
+
+def test_IK_INNE_matches_brute_force():
+    X = np.random.RandomState(0).uniform(size=(300, 4))
+    inne = IK_INNE(n_estimators=50, max_samples=16, random_state=0).fit(X)
+
+    expected = np.zeros((len(X), inne.n_estimators * inne.max_samples_))
+    for i, center_index in enumerate(inne.center_index_set):
+        centers = X[center_index]
+        dists = np.sqrt(((X[:, None] - centers[None]) ** 2).sum(axis=-1))
+        center_dists = np.sqrt(((centers[:, None] - centers[None]) ** 2).sum(axis=-1))
+        np.fill_diagonal(center_dists, np.inf)
+        radius = center_dists.min(axis=1)
+        nearest = dists.argmin(axis=1)
+        covered = dists[np.arange(len(X)), nearest] <= radius[nearest]
+        expected[covered, i * inne.max_samples_ + nearest[covered]] = 1
+
+    assert np.array_equal(inne.transform(X).toarray(), expected)